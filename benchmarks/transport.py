@@ -0,0 +1,128 @@
+# coding: utf-8
+"""
+Compares client CPU time per API call of ``RequestsTransport`` and
+``Urllib3Transport``.
+
+A keep-alive HTTP server which returns a small JSON object runs in a separate
+process, so only the client's CPU time is measured. Every transport makes
+``--calls`` calls per run, the median of ``--runs`` runs is reported.
+
+Usage::
+
+    $ python benchmarks/transport.py --calls 3000 --runs 7
+
+"""
+import argparse
+import socket
+import subprocess
+import sys
+import time
+
+import pyodnoklassniki
+
+try:
+    from time import process_time
+except ImportError:
+    # Python 2.7, ``time.clock`` is processor time on Unix.
+    from time import clock as process_time
+
+SERVER = r'''
+import socket
+import sys
+import threading
+
+body = b'{"uid": "1", "name": "Ivan"}'
+response = (b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+            b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+
+
+def handle(conn):
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    buf = b''
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            return
+        buf += data
+        while b'\r\n\r\n' in buf:
+            _, buf = buf.split(b'\r\n\r\n', 1)
+            conn.sendall(response)
+
+
+sock = socket.socket()
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+sock.bind(('127.0.0.1', int(sys.argv[1])))
+sock.listen(64)
+while True:
+    conn, _ = sock.accept()
+    thread = threading.Thread(target=handle, args=(conn,))
+    thread.daemon = True
+    thread.start()
+'''
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for_server(port, timeout=5):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def cpu_per_call(transport, calls):
+    pyodnoklassniki.transport = transport
+    api = pyodnoklassniki.OdnoklassnikiAPI(access_token='access token')
+    method = api.users.getCurrentUser
+
+    # Warms up connection pool.
+    for _ in range(100):
+        method(fields='name')
+
+    started_at = process_time()
+    for _ in range(calls):
+        method(fields='name')
+    return (process_time() - started_at) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--calls', type=int, default=3000)
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-c', SERVER, str(port)])
+    try:
+        wait_for_server(port)
+        pyodnoklassniki.app_pub_key = 'app key'
+        pyodnoklassniki.app_secret_key = 'app secret key'
+        pyodnoklassniki.api_base = 'http://127.0.0.1:{0}/fb.do'.format(port)
+
+        transports = [
+            ('requests', pyodnoklassniki.RequestsTransport),
+            ('urllib3', pyodnoklassniki.Urllib3Transport),
+        ]
+        for name, transport_class in transports:
+            timings = sorted(cpu_per_call(transport_class(), args.calls)
+                             for _ in range(args.runs))
+            print('{0:<9} median {1:7.1f} us/call  (min {2:.1f}, max {3:.1f})'
+                  .format(name, timings[len(timings) // 2] * 1e6,
+                          timings[0] * 1e6, timings[-1] * 1e6))
+    finally:
+        server.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,10 @@ Usage example::
     >>> ok_api.users.getCurrentUser()
 
 """
-from .requestor import APIRequestor, SessionAPIRequestor, OAuth2APIRequestor
+from .requestor import (
+    APIRequestor, SessionAPIRequestor, OAuth2APIRequestor,
+    RequestsTransport, Urllib3Transport
+)
 from .exceptions import OdnoklassnikiError, AuthError, InvalidRequestError
 from . import errors
 
@@ -20,6 +23,8 @@ from . import errors
 app_pub_key = None
 app_secret_key = None
 api_base = 'http://api.odnoklassniki.ru/fb.do'
+# HTTP transport used by API requestors, ``RequestsTransport`` if not set.
+transport = None
 
 
 class OdnoklassnikiAPI(object):
@@ -110,17 +115,20 @@ class OdnoklassnikiAPI(object):
                 app_pub_key=app_pub_key,
                 app_secret_key=app_secret_key,
                 access_token=self._access_token,
-                api_base=api_base
+                api_base=api_base,
+                transport=transport
             )
         if self._session_secret_key or self._session_key:
             return SessionAPIRequestor(
                 app_pub_key=app_pub_key,
                 session_secret_key=self._session_secret_key,
                 session_key=self._session_key,
-                api_base=api_base
+                api_base=api_base,
+                transport=transport
             )
         return APIRequestor(
             app_pub_key=app_pub_key,
             app_secret_key=app_secret_key,
-            api_base=api_base
+            api_base=api_base,
+            transport=transport
         )
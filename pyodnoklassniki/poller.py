@@ -0,0 +1,390 @@
+# coding: utf-8
+"""
+Incremental poller of feeds and group content.
+
+Poller keeps per source checkpoint (markers of the last seen items and
+paging anchor to resume from) and fetches pages from the head of a list
+only until it reaches already seen item. Sources are polled adaptively:
+source which changes often is polled often, quiet source is polled rarely.
+
+Usage example::
+
+    >>> ok_api = OdnoklassnikiAPI(access_token='kjdhfldjfhgldsjhfglkdjfg9ds8fg0sdf8gsd8fg')
+    >>> poller = Poller(SQLiteCheckpointStore('checkpoints.db'))
+    >>> poller.add(MediaTopicSource('group:123', ok_api.mediatopic.getTopics,
+    ...                             gid=123, fields='media_topic.*'))
+    >>> poller.add(DiscussionSource('discussions', ok_api.discussions.getList))
+    >>> for event in poller.events():
+    ...     print(event.source_key, len(event.items))
+
+"""
+import heapq
+import json
+import sqlite3
+import time
+from collections import namedtuple
+from hashlib import md5
+
+
+ChangeEvent = namedtuple('ChangeEvent', ['source_key', 'items', 'anchor',
+                                         'gap'])
+
+
+class Source(object):
+    """Paginated list of items returned by API method, newest first.
+
+    ``api_method`` is a callable API method, e.g.,
+    ``ok_api.mediatopic.getTopics``, ``query_params`` are passed on every
+    call.
+
+    """
+
+    items_key = None
+    id_key = 'id'
+    anchor_param = 'anchor'
+    anchor_key = 'anchor'
+    has_more_key = 'has_more'
+
+    def __init__(self, key, api_method, **query_params):
+        self.key = key
+        self.api_method = api_method
+        self.query_params = query_params
+
+    def fetch(self, anchor=None):
+        """Returns ``(items, anchor, has_more)`` of a page which follows
+        ``anchor`` or the first page if ``anchor`` is not set.
+
+        """
+        query_params = dict(self.query_params)
+        if anchor is not None:
+            query_params[self.anchor_param] = anchor
+
+        response = self.api_method(**query_params) or {}
+        return (
+            response.get(self.items_key) or [],
+            response.get(self.anchor_key),
+            bool(response.get(self.has_more_key)),
+        )
+
+    def marker(self, item):
+        """Returns marker which identifies item's state."""
+        return str(item[self.id_key])
+
+    def watermark(self, item):
+        """Returns comparable value which grows when item changes, e.g.,
+        last activity date, or ``None`` if list is ordered by creation.
+
+        """
+        return None
+
+
+class StreamSource(Source):
+    """Source of ``stream.get`` feeds.
+
+    Feeds have no id, so a feed is identified by its content fingerprint.
+
+    """
+
+    items_key = 'feeds'
+
+    def fetch(self, anchor=None):
+        items, anchor, has_more = super(StreamSource, self).fetch(anchor)
+        # ``stream.get`` might not return ``has_more``, an empty page ends it.
+        return items, anchor, has_more or bool(items and anchor)
+
+    def marker(self, item):
+        content = json.dumps(item, sort_keys=True).encode('utf-8')
+        return md5(content).hexdigest()
+
+
+class MediaTopicSource(Source):
+    """Source of ``mediatopic.getTopics`` topics."""
+
+    items_key = 'media_topics'
+
+
+class DiscussionSource(Source):
+    """Source of ``discussions.getList`` discussions.
+
+    Discussions are ordered by last activity, so a discussion with new
+    comments is reported again.
+
+    """
+
+    items_key = 'discussions'
+    id_key = 'object_id'
+    anchor_param = 'pagingAnchor'
+
+    def marker(self, item):
+        return '{0}:{1}'.format(item[self.id_key],
+                                item.get('last_activity_date', ''))
+
+    def watermark(self, item):
+        return item.get('last_activity_date')
+
+
+class MemoryCheckpointStore(object):
+    """Keeps checkpoints in memory, they are lost on restart."""
+
+    def __init__(self):
+        self._checkpoints = {}
+
+    def load(self, key):
+        return self._checkpoints.get(key)
+
+    def save(self, key, checkpoint):
+        self._checkpoints[key] = checkpoint
+
+
+class SQLiteCheckpointStore(object):
+    """Keeps checkpoints as JSON in SQLite database."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS checkpoint '
+            '(key TEXT PRIMARY KEY, state TEXT NOT NULL)'
+        )
+        self._conn.commit()
+
+    def load(self, key):
+        row = self._conn.execute(
+            'SELECT state FROM checkpoint WHERE key = ?', (key,)
+        ).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+
+    def save(self, key, checkpoint):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO checkpoint (key, state) VALUES (?, ?)',
+            (key, json.dumps(checkpoint))
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class Poller(object):
+    """Polls sources and emits ``ChangeEvent`` with new items.
+
+    Checkpoint of a source holds:
+
+    - ``seen`` markers of the latest items, at most ``seen_limit``;
+    - ``watermark`` the highest watermark of seen items, if source has
+      watermarks. Scan stops at item below it, so items which changed and
+      thereby got new markers do not make older items look new;
+    - ``resume`` anchor, seen markers and watermark to continue fetching
+      older new items from, if they did not fit into ``max_pages`` pages;
+    - ``rate`` observed number of new items per second;
+    - ``polled_at`` time of the last poll.
+
+    Poll interval is ``1 / rate`` (the time it takes one new item to appear)
+    limited by ``min_interval`` and ``max_interval``. Rate is smoothed with
+    ``smoothing`` factor. At most ``max_pages`` pages are fetched per poll,
+    the rest of new items is fetched on the next polls. If it overflows again
+    before the rest is fetched, the event has ``gap`` set: some new items
+    have been skipped.
+
+    Errors are passed to ``error_callback(source, exc)``. If it is not set,
+    the error is raised and events collected so far in that round are
+    returned by the next ``poll_due`` call. Failed source is polled again
+    after ``max_interval``.
+
+    """
+
+    def __init__(self, store=None, min_interval=60, max_interval=3600,
+                 max_pages=5, seen_limit=50, smoothing=0.3,
+                 error_callback=None, clock=time.time, sleep=time.sleep):
+        self.store = store or MemoryCheckpointStore()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_pages = max_pages
+        self.seen_limit = seen_limit
+        self.smoothing = smoothing
+        self.error_callback = error_callback
+        self._clock = clock
+        self._sleep = sleep
+
+        self._sources = {}
+        self._due = {}
+        self._schedule = []
+        self._pending_events = []
+
+    def add(self, source):
+        """Adds source, it is due immediately unless its checkpoint says
+        otherwise.
+
+        """
+        self._sources[source.key] = source
+        checkpoint = self.store.load(source.key)
+        if checkpoint is None:
+            due_at = self._clock()
+        else:
+            due_at = checkpoint['polled_at'] + self._interval(checkpoint['rate'])
+        self._reschedule(source.key, due_at)
+
+    def remove(self, key):
+        del self._sources[key]
+        del self._due[key]
+
+    def poll(self, source):
+        """Polls source and returns ``ChangeEvent`` or ``None`` if nothing
+        has changed.
+
+        """
+        now = self._clock()
+        checkpoint = self.store.load(source.key) or {
+            'seen': [],
+            'watermark': None,
+            'resume': None,
+            'rate': 0.0,
+            'polled_at': None,
+        }
+        resume = checkpoint.get('resume')
+        initial = checkpoint['polled_at'] is None
+        gap = False
+
+        # Only the first page is needed when nothing has been seen before.
+        max_pages = 1 if initial else self.max_pages
+        new_items, new_markers, head_anchor, next_anchor, pages = self._scan(
+            source, None, set(checkpoint['seen']), checkpoint['watermark'],
+            max_pages
+        )
+
+        # Older new items which did not fit into the previous poll.
+        if resume is not None and pages < self.max_pages:
+            items, _, _, resume_anchor, _ = self._scan(
+                source, resume['anchor'], set(resume['seen']),
+                resume['watermark'], self.max_pages - pages
+            )
+            new_items.extend(items)
+            if resume_anchor is None:
+                resume = None
+            else:
+                resume['anchor'] = resume_anchor
+
+        if next_anchor is not None and not initial:
+            if resume is None:
+                resume = {
+                    'anchor': next_anchor,
+                    'seen': checkpoint['seen'],
+                    'watermark': checkpoint['watermark'],
+                }
+            else:
+                # Only one resume anchor is kept, these items are skipped.
+                gap = True
+
+        if not initial:
+            elapsed = max(now - checkpoint['polled_at'], 1)
+            rate = len(new_items) / float(elapsed)
+            checkpoint['rate'] = (self.smoothing * rate +
+                                  (1 - self.smoothing) * checkpoint['rate'])
+        checkpoint['seen'] = (new_markers + checkpoint['seen'])[:self.seen_limit]
+        watermarks = [source.watermark(item) for item in new_items]
+        watermarks = [w for w in watermarks + [checkpoint['watermark']]
+                      if w is not None]
+        if watermarks:
+            checkpoint['watermark'] = max(watermarks)
+        checkpoint['resume'] = resume
+        checkpoint['polled_at'] = now
+        self.store.save(source.key, checkpoint)
+
+        if new_items or gap:
+            return ChangeEvent(source.key, new_items, head_anchor, gap)
+
+    def _scan(self, source, anchor, seen, watermark, max_pages):
+        """Fetches pages starting from ``anchor`` until seen item or item
+        below ``watermark`` is reached.
+
+        Returns ``(items, markers, first_anchor, next_anchor, pages)``,
+        where ``next_anchor`` is set if ``max_pages`` pages have been
+        fetched, but seen item has not been reached yet.
+
+        """
+        new_items = []
+        new_markers = []
+        first_anchor = None
+        for page in range(max_pages):
+            items, anchor, has_more = source.fetch(anchor)
+            if page == 0:
+                first_anchor = anchor
+
+            for item in items:
+                marker = source.marker(item)
+                item_watermark = None
+                if watermark is not None:
+                    item_watermark = source.watermark(item)
+
+                if item_watermark is not None:
+                    if item_watermark < watermark:
+                        return (new_items, new_markers, first_anchor, None,
+                                page + 1)
+                    # Items with the same watermark are told by markers.
+                    if item_watermark == watermark and marker in seen:
+                        continue
+                elif marker in seen:
+                    return new_items, new_markers, first_anchor, None, page + 1
+                new_items.append(item)
+                new_markers.append(marker)
+
+            if not has_more:
+                return new_items, new_markers, first_anchor, None, page + 1
+        return new_items, new_markers, first_anchor, anchor, max_pages
+
+    def poll_due(self):
+        """Polls due sources and returns list of ``ChangeEvent``."""
+        events, self._pending_events = self._pending_events, []
+        now = self._clock()
+        while self._schedule and self._schedule[0][0] <= now:
+            due_at, key = heapq.heappop(self._schedule)
+            # Entry of removed or rescheduled source.
+            if self._due.get(key) != due_at:
+                continue
+            source = self._sources[key]
+
+            try:
+                event = self.poll(source)
+            except Exception as exc:
+                self._reschedule(key, now + self.max_interval)
+                if self.error_callback is None:
+                    # Checkpoints of these events are saved already.
+                    self._pending_events = events
+                    raise
+                self.error_callback(source, exc)
+                continue
+
+            rate = self.store.load(key)['rate']
+            self._reschedule(key, now + self._interval(rate))
+            if event is not None:
+                events.append(event)
+        return events
+
+    def events(self):
+        """Yields ``ChangeEvent`` forever, sleeps until the next source
+        is due.
+
+        """
+        while True:
+            for event in self.poll_due():
+                yield event
+            if self._schedule:
+                delay = self._schedule[0][0] - self._clock()
+            else:
+                delay = self.min_interval
+            if delay > 0:
+                self._sleep(delay)
+
+    def run(self, callback):
+        """Passes every ``ChangeEvent`` to ``callback``."""
+        for event in self.events():
+            callback(event)
+
+    def _reschedule(self, key, due_at):
+        self._due[key] = due_at
+        heapq.heappush(self._schedule, (due_at, key))
+
+    def _interval(self, rate):
+        if rate <= 0:
+            return self.max_interval
+        return min(max(1 / rate, self.min_interval), self.max_interval)
@@ -1,7 +1,17 @@
 # coding: utf-8
+import json
 from hashlib import md5
 
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
 import requests
+try:
+    import urllib3
+except ImportError:
+    from requests.packages import urllib3
 
 from .exceptions import (
     APIConnectionError, APIError, AuthError, InvalidRequestError
@@ -28,36 +38,141 @@ def json_api_response(api_url, query_params):
             http_status_code=response.status_code
         )
 
+    return _handle_json_response(json_resp, response.content,
+                                 response.status_code)
+
+
+def _handle_json_response(json_resp, http_content, http_status_code):
     # Special case when API method returns empty list.
     if not json_resp:
         return json_resp
 
-    if 'error_code' not in json_resp:
+    # API methods such as ``users.setStatus`` return bare ``true``.
+    if not isinstance(json_resp, dict) or 'error_code' not in json_resp:
         return json_resp
     else:
         error_message = json_resp.get('error_msg')
         if json_resp['error_code'] in AuthError.CODES:
             raise AuthError(
                 message=error_message,
-                http_content=response.content,
-                http_status_code=response.status_code,
+                http_content=http_content,
+                http_status_code=http_status_code,
                 code=json_resp['error_code']
             )
         if json_resp['error_code'] in InvalidRequestError.CODES:
             raise InvalidRequestError(
                 message=error_message,
-                http_content=response.content,
-                http_status_code=response.status_code,
+                http_content=http_content,
+                http_status_code=http_status_code,
                 code=json_resp['error_code']
             )
         raise APIError(
             message=error_message,
-            http_content=response.content,
-            http_status_code=response.status_code,
+            http_content=http_content,
+            http_status_code=http_status_code,
             code=json_resp['error_code']
         )
 
 
+def _urlencode(query_params, skip=()):
+    """Encodes query parameters the way ``requests`` does: ``None`` values
+    are skipped, text values are UTF-8 encoded, list values are sent as
+    repeated keys. Parameters named in ``skip`` are left out.
+
+    """
+    encoded = []
+    for name, value in query_params.items():
+        if value is None or name in skip:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = [_encode_value(v) for v in value if v is not None]
+        else:
+            value = _encode_value(value)
+        encoded.append((name, value))
+    return urlencode(encoded, doseq=True)
+
+
+def _encode_value(value):
+    if not isinstance(value, bytes) and hasattr(value, 'encode'):
+        return value.encode('utf-8')
+    return value
+
+
+class RequestsTransport(object):
+    """Default transport, it sends requests with ``requests.Session``.
+
+    Transport interface consists of two methods:
+
+    - ``encode_static(static_params)`` is called once per requestor and
+      prepares parameters which are sent with every request, e.g.,
+      ``application_key``, ``format``, ``access_token``;
+    - ``get(api_url, static, query_params)`` sends request with prepared
+      static parameters and per call ``query_params``, and returns decoded
+      JSON response.
+
+    """
+
+    def encode_static(self, static_params):
+        return static_params
+
+    def get(self, api_url, static, query_params):
+        query_params.update(static)
+        return json_api_response(api_url, query_params)
+
+
+class Urllib3Transport(object):
+    """Lean transport built directly on ``urllib3`` connection pool.
+
+    It bypasses ``requests`` machinery (hooks, cookies, redirects,
+    parameters re-encoding): static query part is url-encoded once per
+    requestor and response is decoded straight from the body bytes.
+    As in ``RequestsTransport``, static parameters take precedence over
+    per call ones with the same name.
+
+    Unlike ``RequestsTransport`` it does not use ``HTTP_PROXY`` /
+    ``HTTPS_PROXY`` environment variables and does not follow redirects
+    (redirect response is decoded as is). Pass ``urllib3.ProxyManager`` as
+    ``pool`` if you need a proxy.
+
+    See ``benchmarks/transport.py`` for CPU time comparison.
+
+    Usage example::
+
+        >>> import pyodnoklassniki
+        >>> pyodnoklassniki.transport = Urllib3Transport()
+
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool or urllib3.PoolManager()
+
+    def encode_static(self, static_params):
+        return frozenset(static_params), _urlencode(static_params)
+
+    def get(self, api_url, static, query_params):
+        static_names, static_query = static
+        url = '{0}?{1}&{2}'.format(
+            api_url, static_query, _urlencode(query_params, skip=static_names)
+        )
+        try:
+            response = self.pool.urlopen('GET', url, retries=False)
+        except urllib3.exceptions.HTTPError as exc:
+            raise APIConnectionError(
+                message='Network communication error: {0}'.format(exc)
+            )
+
+        try:
+            json_resp = json.loads(response.data)
+        except ValueError as exc:
+            raise APIError(
+                message='Invalid response object: {0}'.format(exc.args[0]),
+                http_content=response.data,
+                http_status_code=response.status
+            )
+
+        return _handle_json_response(json_resp, response.data, response.status)
+
+
 class APIRequestor(object):
     """Odnoklassniki Non Session API requestor.
 
@@ -71,17 +186,24 @@ class APIRequestor(object):
 
     """
 
-    def __init__(self, app_pub_key, app_secret_key, api_base):
+    def __init__(self, app_pub_key, app_secret_key, api_base, transport=None):
         self.app_pub_key = app_pub_key
         self.app_secret_key = app_secret_key
         self.api_base = api_base
+        self.transport = transport or RequestsTransport()
+
+        self._static_params = {
+            'application_key': self.app_pub_key,
+            'format': 'JSON',
+        }
+        self._static = self.transport.encode_static(self._static_params)
 
     def get(self, **query_params):
-        query_params['application_key'] = self.app_pub_key
-        query_params['format'] = 'JSON'
-        query_params['sig'] = self._signature(query_params)
+        params = dict(query_params)
+        params.update(self._static_params)
+        query_params['sig'] = self._signature(params)
 
-        return json_api_response(self.api_base, query_params)
+        return self.transport.get(self.api_base, self._static, query_params)
 
     def _signature(self, params):
         """Returns signature.
@@ -120,19 +242,27 @@ class SessionAPIRequestor(object):
 
     """
 
-    def __init__(self, app_pub_key, session_secret_key, session_key, api_base):
+    def __init__(self, app_pub_key, session_secret_key, session_key, api_base,
+                 transport=None):
         self.app_pub_key = app_pub_key
         self.session_secret_key = session_secret_key
         self.session_key = session_key
         self.api_base = api_base
+        self.transport = transport or RequestsTransport()
+
+        self._static_params = {
+            'application_key': self.app_pub_key,
+            'format': 'JSON',
+            'session_key': self.session_key,
+        }
+        self._static = self.transport.encode_static(self._static_params)
 
     def get(self, **query_params):
-        query_params['application_key'] = self.app_pub_key
-        query_params['format'] = 'JSON'
-        query_params['session_key'] = self.session_key
-        query_params['sig'] = self._signature(query_params)
+        params = dict(query_params)
+        params.update(self._static_params)
+        query_params['sig'] = self._signature(params)
 
-        return json_api_response(self.api_base, query_params)
+        return self.transport.get(self.api_base, self._static, query_params)
 
     def _signature(self, params):
         """Returns signature.
@@ -171,19 +301,27 @@ class OAuth2APIRequestor(object):
 
     """
 
-    def __init__(self, app_pub_key, app_secret_key, access_token, api_base):
+    def __init__(self, app_pub_key, app_secret_key, access_token, api_base,
+                 transport=None):
         self.app_pub_key = app_pub_key
         self.app_secret_key = app_secret_key
         self.access_token = access_token
         self.api_base = api_base
+        self.transport = transport or RequestsTransport()
+
+        self._static_params = {
+            'application_key': self.app_pub_key,
+            'format': 'JSON',
+            'access_token': self.access_token,
+        }
+        self._static = self.transport.encode_static(self._static_params)
 
     def get(self, **query_params):
-        query_params['application_key'] = self.app_pub_key
-        query_params['format'] = 'JSON'
-        query_params['access_token'] = self.access_token
-        query_params['sig'] = self._signature(query_params)
+        params = dict(query_params)
+        params.update(self._static_params)
+        query_params['sig'] = self._signature(params)
 
-        return json_api_response(self.api_base, query_params)
+        return self.transport.get(self.api_base, self._static, query_params)
 
     def _signature(self, params):
         """Returns signature.
@@ -0,0 +1,423 @@
+# coding: utf-8
+"""
+Write-behind dispatcher of mutating API calls.
+
+Calls are spooled to SQLite database and return immediately, dispatcher
+executes them later with bounded concurrency.
+
+Usage example::
+
+    >>> ok_api = OdnoklassnikiAPI(access_token='kjdhfldjfhgldsjhfglkdjfg9ds8fg0sdf8gsd8fg')
+    >>> dispatcher = WriteBehindDispatcher(SQLiteSpool('spool.db'))
+    >>> dispatcher.start()
+    >>> dispatcher.submit(ok_api.users.setStatus, status='Hello')
+    >>> dispatcher.submit(ok_api.notifications.sendSimple, uid=123, text='Hi')
+
+Only one dispatcher should drain a spool, though many processes can
+submit calls to it.
+
+Spool file contains credentials (access tokens, session keys) of spooled
+calls and dead letters, so protect it as you protect other secrets and purge
+dead letters you no longer need.
+
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from hashlib import md5
+from multiprocessing.pool import ThreadPool
+
+from . import errors, OdnoklassnikiAPI
+from .exceptions import AuthError, InvalidRequestError
+
+
+SpooledCall = namedtuple('SpooledCall', ['id', 'call', 'attempts'])
+DeadLetter = namedtuple('DeadLetter', ['id', 'call', 'error_code',
+                                       'error_message', 'failed_at'])
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteSpool(object):
+    """Durable queue of API calls kept in SQLite database.
+
+    Call is a dict of API method name, query parameters and credentials,
+    they are stored in plain text. Every thread uses its own connection.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS spool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                call TEXT NOT NULL,
+                dedup_key TEXT NOT NULL,
+                coalesce_key TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                not_before REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS spool_dedup_key ON spool (dedup_key);
+            CREATE INDEX IF NOT EXISTS spool_coalesce_key ON spool (coalesce_key);
+            CREATE TABLE IF NOT EXISTS dead_letter (
+                id INTEGER PRIMARY KEY,
+                call TEXT NOT NULL,
+                error_code INTEGER,
+                error_message TEXT,
+                failed_at REAL NOT NULL
+            );
+        """)
+
+    @property
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Transactions are managed explicitly.
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def put(self, call, coalesce=False, not_before=0):
+        """Spools call and returns its id.
+
+        Identical pending call is not spooled twice. If ``coalesce`` is set,
+        pending calls of the same method with the same credentials are
+        replaced by this one.
+
+        """
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            call_id = self._insert(call, coalesce, not_before)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return call_id
+
+    def _insert(self, call, coalesce, not_before):
+        dedup_key = _digest(call)
+        coalesce_key = None
+        if coalesce:
+            coalesce_key = _coalesce_key(call)
+
+        row = self._conn.execute(
+            'SELECT id FROM spool WHERE dedup_key = ?', (dedup_key,)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+
+        if coalesce_key is not None:
+            self._conn.execute('DELETE FROM spool WHERE coalesce_key = ?',
+                               (coalesce_key,))
+        cursor = self._conn.execute(
+            'INSERT INTO spool (call, dedup_key, coalesce_key, not_before) '
+            'VALUES (?, ?, ?, ?)',
+            (json.dumps(call), dedup_key, coalesce_key, not_before)
+        )
+        return cursor.lastrowid
+
+    def ready(self, now, limit):
+        """Returns at most ``limit`` calls which are due at ``now``."""
+        rows = self._conn.execute(
+            'SELECT id, call, attempts FROM spool WHERE not_before <= ? '
+            'ORDER BY id LIMIT ?', (now, limit)
+        ).fetchall()
+        return [SpooledCall(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def delete(self, call_id):
+        self._conn.execute('DELETE FROM spool WHERE id = ?', (call_id,))
+
+    def lease(self, call_ids, until):
+        """Postpones calls until ``until`` while they are executed."""
+        self._conn.executemany(
+            'UPDATE spool SET not_before = ? WHERE id = ?',
+            [(until, call_id) for call_id in call_ids]
+        )
+
+    def retry(self, call_id, not_before, attempts):
+        self._conn.execute(
+            'UPDATE spool SET not_before = ?, attempts = ? WHERE id = ?',
+            (not_before, attempts, call_id)
+        )
+
+    def bury(self, call_id, error_code, error_message, failed_at):
+        """Moves call to dead letters."""
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT INTO dead_letter '
+                '(id, call, error_code, error_message, failed_at) '
+                'SELECT id, call, ?, ?, ? FROM spool WHERE id = ?',
+                (error_code, error_message, failed_at, call_id)
+            )
+            conn.execute('DELETE FROM spool WHERE id = ?', (call_id,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def dead_letters(self):
+        rows = self._conn.execute(
+            'SELECT id, call, error_code, error_message, failed_at '
+            'FROM dead_letter ORDER BY id'
+        ).fetchall()
+        return [DeadLetter(row[0], json.loads(row[1]), *row[2:]) for row in rows]
+
+    def requeue_dead_letter(self, dead_letter_id, coalesce_methods=(),
+                            not_before=0):
+        """Moves dead letter back to spool and returns id of spooled call.
+
+        Dead letter of ``coalesce_methods`` is older than any pending call
+        with the same method and credentials, so it is dropped in favour of
+        such call, and id of that call is returned.
+
+        Raises ``KeyError`` if there is no such dead letter.
+
+        """
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT call FROM dead_letter WHERE id = ?', (dead_letter_id,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(dead_letter_id)
+            conn.execute('DELETE FROM dead_letter WHERE id = ?',
+                         (dead_letter_id,))
+            call = json.loads(row[0])
+            call_id = None
+            coalesce = call['method'] in coalesce_methods
+            if coalesce:
+                newer = conn.execute(
+                    'SELECT id FROM spool WHERE coalesce_key = ?',
+                    (_coalesce_key(call),)
+                ).fetchone()
+                if newer is not None:
+                    call_id = newer[0]
+            if call_id is None:
+                call_id = self._insert(call, coalesce, not_before)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return call_id
+
+    def purge_dead_letters(self, before):
+        """Deletes dead letters failed before ``before`` timestamp and
+        returns their number.
+
+        """
+        cursor = self._conn.execute(
+            'DELETE FROM dead_letter WHERE failed_at < ?', (before,)
+        )
+        return cursor.rowcount
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM spool').fetchone()[0]
+
+
+class WriteBehindDispatcher(object):
+    """Spools mutating API calls and executes them in background.
+
+    - identical pending calls are deduplicated, pending calls of
+      ``coalesce_methods`` are replaced by the latest one (the last write
+      wins), e.g., ``users.setStatus``;
+    - at most ``concurrency`` calls are executed at once, ``batch_size``
+      calls are taken from spool per drain. Taken calls are leased for
+      ``lease_timeout`` seconds, so they are not taken again while they are
+      executed. If result of a call could not be recorded, e.g., database
+      is locked, the call is executed again once its lease expires;
+    - rate limit errors (``pause_codes``: ``FLOOD_BLOCKED``,
+      ``LIMIT_REACHED``) pause all calls for ``flood_delay`` seconds, the
+      pause doubles up to ``max_flood_delay`` while API keeps blocking;
+    - ``InvalidRequestError`` and other ``AuthError`` are permanent, such
+      call is moved to dead letters at once;
+    - other errors, including unexpected exceptions, are retried after
+      ``retry_delay * 2 ** attempts`` seconds, call is moved to dead letters
+      after ``max_attempts``.
+
+    """
+
+    coalesce_methods = ('users.setStatus',)
+    pause_codes = (errors.FLOOD_BLOCKED, errors.LIMIT_REACHED)
+
+    def __init__(self, spool, concurrency=4, batch_size=100, max_attempts=5,
+                 retry_delay=1, flood_delay=10, max_flood_delay=600,
+                 lease_timeout=300, poll_interval=1, clock=time.time):
+        self.spool = spool
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.flood_delay = flood_delay
+        self.max_flood_delay = max_flood_delay
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self._clock = clock
+
+        self._paused_until = 0
+        self._next_flood_delay = flood_delay
+        self._flood_lock = threading.Lock()
+        self._pool = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def submit(self, api_method, **query_params):
+        """Spools call of API method, e.g.,
+        ``dispatcher.submit(ok_api.users.setStatus, status='Hello')``.
+
+        """
+        if not api_method._api_method:
+            raise TypeError("'OdnoklassnikiAPI' object is not callable")
+
+        call = {
+            'method': api_method._api_method,
+            'params': query_params,
+            'access_token': api_method._access_token,
+            'session_secret_key': api_method._session_secret_key,
+            'session_key': api_method._session_key,
+        }
+        coalesce = call['method'] in self.coalesce_methods
+        return self.spool.put(call, coalesce=coalesce)
+
+    def requeue_dead_letter(self, dead_letter_id):
+        """Moves dead letter back to spool, e.g., after its cause has been
+        fixed.
+
+        """
+        return self.spool.requeue_dead_letter(
+            dead_letter_id, coalesce_methods=self.coalesce_methods
+        )
+
+    def drain(self):
+        """Executes due calls and returns number of succeeded ones."""
+        now = self._clock()
+        if now < self._paused_until:
+            return 0
+
+        calls = self.spool.ready(now, self.batch_size)
+        if not calls:
+            return 0
+        self.spool.lease([spooled.id for spooled in calls],
+                         now + self.lease_timeout)
+
+        if self._pool is None:
+            self._pool = ThreadPool(self.concurrency)
+
+        succeeded = 0
+        record_error = None
+        for spooled, exc in self._pool.imap_unordered(self._execute, calls):
+            # All results are awaited, so that no call of this batch is still
+            # executed when drain returns or raises.
+            try:
+                if exc is None:
+                    self.spool.delete(spooled.id)
+                    self._next_flood_delay = self.flood_delay
+                    succeeded += 1
+                else:
+                    self._handle_error(spooled, exc)
+            except Exception as error:
+                logger.exception('Result of spooled call %s is not recorded',
+                                 spooled.id)
+                record_error = record_error or error
+        if record_error is not None:
+            raise record_error
+        return succeeded
+
+    def start(self):
+        """Starts draining spool in background thread."""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops background thread, pending calls stay in spool."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                succeeded = self.drain()
+            except Exception:
+                # One bad batch must not stop the dispatcher.
+                logger.exception('Write-behind drain failed')
+                succeeded = 0
+            if not succeeded:
+                self._stopped.wait(self.poll_interval)
+
+    def _execute(self, spooled):
+        # Calls which were not started before flood block are skipped.
+        if self._clock() < self._paused_until:
+            return spooled, _Paused()
+
+        call = spooled.call
+        try:
+            api = OdnoklassnikiAPI(
+                access_token=call['access_token'],
+                session_secret_key=call['session_secret_key'],
+                session_key=call['session_key']
+            )
+            group, name = call['method'].split('.', 1)
+            getattr(getattr(api, group), name)(**call['params'])
+        except Exception as exc:
+            if self._is_rate_limited(exc):
+                # Pause is set right away so that other workers stop as well.
+                self._pause()
+            return spooled, exc
+        return spooled, None
+
+    def _is_rate_limited(self, exc):
+        return isinstance(exc, AuthError) and exc.code in self.pause_codes
+
+    def _pause(self):
+        with self._flood_lock:
+            now = self._clock()
+            if now >= self._paused_until:
+                self._paused_until = now + self._next_flood_delay
+                self._next_flood_delay = min(self._next_flood_delay * 2,
+                                             self.max_flood_delay)
+
+    def _handle_error(self, spooled, exc):
+        now = self._clock()
+
+        if isinstance(exc, _Paused) or self._is_rate_limited(exc):
+            self.spool.retry(spooled.id, self._paused_until, spooled.attempts)
+            return
+
+        attempts = spooled.attempts + 1
+        if (isinstance(exc, (InvalidRequestError, AuthError)) or
+                attempts >= self.max_attempts):
+            self.spool.bury(spooled.id, getattr(exc, 'code', None),
+                            getattr(exc, 'message', str(exc)), now)
+            return
+
+        self.spool.retry(spooled.id,
+                         now + self.retry_delay * 2 ** spooled.attempts,
+                         attempts)
+
+
+class _Paused(object):
+    """Marks call skipped because of rate limit pause."""
+
+
+def _digest(call):
+    return md5(json.dumps(call, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _coalesce_key(call):
+    # The same method called with the same credentials.
+    return _digest(dict(call, params=None))
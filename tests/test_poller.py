@@ -0,0 +1,240 @@
+# coding: utf-8
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+import mock
+
+from pyodnoklassniki import AuthError, errors
+from pyodnoklassniki.poller import (
+    Poller, MediaTopicSource, DiscussionSource, SQLiteCheckpointStore
+)
+from .utils import FakeClock
+
+
+def topics_page(ids, anchor, has_more=True):
+    return {
+        'media_topics': [{'id': topic_id} for topic_id in ids],
+        'anchor': anchor,
+        'has_more': has_more,
+    }
+
+
+class PollerPollTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.api_method = mock.Mock()
+        self.source = MediaTopicSource('group:1', self.api_method, gid=1)
+        self.poller = Poller(clock=self.clock)
+
+    def test_first_poll_emits_first_page_only(self):
+        self.api_method.return_value = topics_page(['3', '2'], 'a1')
+
+        event = self.poller.poll(self.source)
+
+        self.assertEqual(event.source_key, 'group:1')
+        self.assertEqual(event.items, [{'id': '3'}, {'id': '2'}])
+        self.assertEqual(event.anchor, 'a1')
+        self.api_method.assert_called_once_with(gid=1)
+
+    def test_poll_stops_at_last_seen_item(self):
+        self.api_method.return_value = topics_page(['2', '1'], 'a1')
+        self.poller.poll(self.source)
+
+        self.api_method.side_effect = [
+            topics_page(['5', '4'], 'a2'),
+            topics_page(['3', '2'], 'a3'),
+        ]
+        event = self.poller.poll(self.source)
+
+        self.assertEqual(event.items, [{'id': '5'}, {'id': '4'}, {'id': '3'}])
+        self.assertEqual(event.anchor, 'a2')
+        self.api_method.assert_called_with(gid=1, anchor='a2')
+
+    def test_items_beyond_max_pages_are_fetched_on_next_poll(self):
+        self.poller.max_pages = 2
+        self.api_method.return_value = topics_page(['1'], 'a1')
+        self.poller.poll(self.source)
+
+        self.api_method.side_effect = [
+            topics_page(['7', '6'], 'a2'),
+            topics_page(['5', '4'], 'a3'),
+        ]
+        event = self.poller.poll(self.source)
+        self.assertEqual([t['id'] for t in event.items], ['7', '6', '5', '4'])
+        self.assertFalse(event.gap)
+
+        self.api_method.side_effect = [
+            topics_page(['7', '6'], 'a2'),
+            topics_page(['3', '2'], 'a4'),
+        ]
+        event = self.poller.poll(self.source)
+
+        self.assertEqual([t['id'] for t in event.items], ['3', '2'])
+        self.assertFalse(event.gap)
+        self.api_method.assert_called_with(gid=1, anchor='a3')
+        self.assertIsNotNone(self.poller.store.load('group:1')['resume'])
+
+        self.api_method.side_effect = [
+            topics_page(['7', '6'], 'a2'),
+            topics_page(['1'], 'a5'),
+        ]
+        self.assertIsNone(self.poller.poll(self.source))
+        self.api_method.assert_called_with(gid=1, anchor='a4')
+        self.assertIsNone(self.poller.store.load('group:1')['resume'])
+
+    def test_gap_is_flagged_when_items_overflow_twice(self):
+        self.poller.max_pages = 1
+        self.api_method.return_value = topics_page(['1'], 'a1')
+        self.poller.poll(self.source)
+        self.api_method.return_value = topics_page(['3', '2'], 'a2')
+        self.poller.poll(self.source)
+
+        self.api_method.return_value = topics_page(['5', '4'], 'a3')
+        event = self.poller.poll(self.source)
+
+        self.assertEqual([t['id'] for t in event.items], ['5', '4'])
+        self.assertTrue(event.gap)
+
+    def test_nothing_is_emitted_when_source_is_unchanged(self):
+        self.api_method.return_value = topics_page(['2', '1'], 'a1')
+        self.poller.poll(self.source)
+
+        self.assertIsNone(self.poller.poll(self.source))
+        self.assertEqual(self.api_method.call_count, 2)
+
+    def test_updated_discussion_is_emitted_again(self):
+        source = DiscussionSource('discussions', self.api_method)
+        self.api_method.return_value = {
+            'discussions': [{'object_id': '1', 'last_activity_date': 't1'}],
+        }
+        self.poller.poll(source)
+
+        self.api_method.return_value = {
+            'discussions': [{'object_id': '1', 'last_activity_date': 't2'}],
+        }
+        event = self.poller.poll(source)
+
+        self.assertEqual(event.items, [
+            {'object_id': '1', 'last_activity_date': 't2'}
+        ])
+
+
+    def test_updated_seen_discussions_do_not_make_old_ones_new(self):
+        def discussions_page(activity, anchor):
+            return {
+                'discussions': [
+                    {'object_id': object_id, 'last_activity_date': date}
+                    for object_id, date in activity
+                ],
+                'anchor': anchor,
+                'has_more': True,
+            }
+        source = DiscussionSource('discussions', self.api_method)
+        self.api_method.return_value = discussions_page(
+            [('0', 10), ('1', 9)], 'a1')
+        self.poller.poll(source)
+
+        # Both seen discussions got new comments, so none of seen markers
+        # is in the list anymore.
+        self.api_method.side_effect = [
+            discussions_page([('1', 12), ('0', 11)], 'a2'),
+            discussions_page([('2', 8), ('3', 7)], 'a3'),
+        ]
+        event = self.poller.poll(source)
+
+        self.assertEqual([d['object_id'] for d in event.items], ['1', '0'])
+        self.assertFalse(event.gap)
+        checkpoint = self.poller.store.load('discussions')
+        self.assertEqual(checkpoint['watermark'], 12)
+        self.assertIsNone(checkpoint['resume'])
+
+
+class PollerScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.api_method = mock.Mock(return_value=topics_page(['1'], 'a1'))
+        self.poller = Poller(clock=self.clock, min_interval=10,
+                             max_interval=1000, smoothing=1)
+        self.poller.add(MediaTopicSource('group:1', self.api_method))
+
+    def test_new_source_is_due_immediately(self):
+        self.assertEqual(len(self.poller.poll_due()), 1)
+
+    def test_quiet_source_is_polled_after_max_interval(self):
+        self.poller.poll_due()
+
+        self.clock.now += 999
+        self.assertEqual(self.poller.poll_due(), [])
+        self.assertEqual(self.api_method.call_count, 1)
+
+        self.clock.now += 1
+        self.poller.poll_due()
+        self.assertEqual(self.api_method.call_count, 2)
+
+    def test_changing_source_is_polled_more_often(self):
+        self.poller.poll_due()
+        self.clock.now += 1000
+        self.api_method.return_value = topics_page(['3', '2', '1'], 'a2')
+        self.poller.poll_due()
+
+        # Two new items per 1000 seconds.
+        self.clock.now += 500
+        self.poller.poll_due()
+        self.assertEqual(self.api_method.call_count, 3)
+
+    def test_removed_source_is_not_polled(self):
+        self.poller.remove('group:1')
+
+        self.assertEqual(self.poller.poll_due(), [])
+        self.assertFalse(self.api_method.called)
+
+    def test_events_are_kept_when_error_is_raised(self):
+        self.poller.poll_due()
+        self.clock.now += 1000
+        # It is due at the same time, but polled after ``group:1``.
+        other_method = mock.Mock(side_effect=KeyError('id'))
+        self.poller.add(MediaTopicSource('group:2', other_method))
+        self.api_method.return_value = topics_page(['2', '1'], 'a2')
+
+        with self.assertRaises(KeyError):
+            self.poller.poll_due()
+        self.assertEqual(self.api_method.call_count, 2)
+
+        event, = self.poller.poll_due()
+        self.assertEqual(event.source_key, 'group:1')
+        self.assertEqual(self.api_method.call_count, 2)
+
+    def test_failed_source_is_rescheduled_on_unexpected_error(self):
+        self.api_method.side_effect = KeyError('id')
+        with self.assertRaises(KeyError):
+            self.poller.poll_due()
+
+        self.api_method.side_effect = None
+        self.clock.now += 1000
+
+        self.assertEqual(len(self.poller.poll_due()), 1)
+
+    def test_api_error_is_passed_to_error_callback(self):
+        exc = AuthError('FLOOD_BLOCKED', code=errors.FLOOD_BLOCKED)
+        self.api_method.side_effect = exc
+        self.poller.error_callback = mock.Mock()
+
+        self.assertEqual(self.poller.poll_due(), [])
+        self.assertEqual(self.poller.error_callback.call_args[0][1], exc)
+
+
+class SQLiteCheckpointStoreTest(unittest.TestCase):
+
+    def test_checkpoint_survives_poller_restart(self):
+        store = SQLiteCheckpointStore(':memory:')
+        api_method = mock.Mock(return_value=topics_page(['1'], 'a1'))
+        source = MediaTopicSource('group:1', api_method)
+        Poller(store, clock=FakeClock()).poll(source)
+
+        poller = Poller(store, clock=FakeClock())
+
+        self.assertIsNone(poller.poll(source))
+        self.assertEqual(store.load('group:1')['seen'], ['1'])
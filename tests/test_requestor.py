@@ -9,11 +9,15 @@ try:
 except ImportError:
     import unittest
 import mock
+import requests
+import urllib3
 
 from pyodnoklassniki.requestor import (
-    APIRequestor, SessionAPIRequestor, OAuth2APIRequestor, json_api_response
+    APIRequestor, SessionAPIRequestor, OAuth2APIRequestor, json_api_response,
+    RequestsTransport, Urllib3Transport
 )
-from pyodnoklassniki import AuthError, errors
+from pyodnoklassniki import AuthError, InvalidRequestError, errors
+from pyodnoklassniki.exceptions import APIConnectionError
 from .utils import MockResponse
 
 
@@ -85,3 +89,130 @@ class JSONAPIResponseTest(unittest.TestCase):
             json_api_response(api_url='blah', query_params={})
 
         self.assertEqual(cm.exception.code, errors.PARAM_SESSION_KEY)
+
+    @mock.patch('pyodnoklassniki.requestor.session.get', autospec=True)
+    def test_bare_value_response_is_returned_as_is(self, r_get):
+        r_get.return_value = MockResponse('true')
+
+        self.assertIs(json_api_response(api_url='blah', query_params={}), True)
+
+
+class RequestsTransportTest(unittest.TestCase):
+
+    @mock.patch('pyodnoklassniki.requestor.session.get', autospec=True)
+    def test_static_params_are_merged_into_query(self, r_get):
+        r_get.return_value = MockResponse('{"uid": "1"}')
+        requestor = OAuth2APIRequestor(app_pub_key='app key',
+                                       app_secret_key='app secret key',
+                                       access_token='access token',
+                                       api_base='whatever',
+                                       transport=RequestsTransport())
+
+        requestor.get(method='users.getCurrentUser')
+
+        r_get.assert_called_once_with('whatever', params={
+            'application_key': 'app key',
+            'format': 'JSON',
+            'access_token': 'access token',
+            'method': 'users.getCurrentUser',
+            'sig': 'e28afae77330d3a914f068d0b6ba32ba',
+        })
+
+
+class Urllib3TransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = mock.Mock()
+        self.transport = Urllib3Transport(pool=self.pool)
+        self.requestor = OAuth2APIRequestor(app_pub_key='app key',
+                                            app_secret_key='app secret key',
+                                            access_token='access token',
+                                            api_base='http://whatever',
+                                            transport=self.transport)
+
+    def test_request_url_contains_static_and_signed_query(self):
+        self.pool.urlopen.return_value = mock.Mock(data=b'{"uid": "1"}',
+                                                   status=200)
+
+        response = self.requestor.get(method='users.getCurrentUser')
+
+        self.assertEqual(response, {'uid': '1'})
+        url = self.pool.urlopen.call_args[0][1]
+        base, query = url.split('?')
+        self.assertEqual(base, 'http://whatever')
+        self.assertEqual(sorted(query.split('&')), [
+            'access_token=access+token',
+            'application_key=app+key',
+            'format=JSON',
+            'method=users.getCurrentUser',
+            'sig=e28afae77330d3a914f068d0b6ba32ba',
+        ])
+
+    def test_list_params_are_sent_as_repeated_keys(self):
+        self.pool.urlopen.return_value = mock.Mock(data=b'[]', status=200)
+
+        self.requestor.get(method='users.getInfo', uids=['1', '2'])
+
+        url = self.pool.urlopen.call_args[0][1]
+        self.assertIn('uids=1&uids=2', url)
+
+    def test_static_params_take_precedence_over_query_params(self):
+        self.pool.urlopen.return_value = mock.Mock(data=b'[]', status=200)
+
+        self.requestor.get(method='users.getCurrentUser', format='XML')
+
+        url = self.pool.urlopen.call_args[0][1]
+        self.assertEqual(url.count('format='), 1)
+        self.assertIn('format=JSON', url)
+
+    @mock.patch('pyodnoklassniki.requestor.session.get', autospec=True)
+    def test_query_is_the_same_as_requests_transport_one(self, r_get):
+        r_get.return_value = MockResponse('[]')
+        self.pool.urlopen.return_value = mock.Mock(data=b'[]', status=200)
+        query_params = {
+            'method': 'users.getInfo',
+            'uids': ['1', '2'],
+            'fields': u'имя',
+            'format': 'XML',
+        }
+        OAuth2APIRequestor(app_pub_key='app key',
+                           app_secret_key='app secret key',
+                           access_token='access token',
+                           api_base='http://whatever').get(**query_params)
+        self.requestor.get(**query_params)
+
+        requests_url = requests.Request(
+            'GET', 'http://whatever', params=r_get.call_args[1]['params']
+        ).prepare().url
+        urllib3_url = self.pool.urlopen.call_args[0][1]
+        self.assertEqual(sorted(requests_url.split('?')[1].split('&')),
+                         sorted(urllib3_url.split('?')[1].split('&')))
+
+    def test_none_params_are_skipped(self):
+        self.pool.urlopen.return_value = mock.Mock(data=b'[]', status=200)
+
+        self.requestor.get(method='users.getCurrentUser', fields=None)
+
+        url = self.pool.urlopen.call_args[0][1]
+        self.assertNotIn('fields', url)
+
+    def test_invalid_request_error_when_server_returns_param_error(self):
+        content = b"""{
+            "error_code": 100,
+            "error_data": null,
+            "error_msg": "PARAM : Missed required parameter"
+        }
+        """
+        self.pool.urlopen.return_value = mock.Mock(data=content, status=200)
+
+        with self.assertRaises(InvalidRequestError) as cm:
+            self.requestor.get(method='group.getInfo')
+
+        self.assertEqual(cm.exception.code, errors.PARAM)
+        self.assertEqual(cm.exception.http_content, content)
+
+    def test_connection_error_when_pool_fails(self):
+        self.pool.urlopen.side_effect = urllib3.exceptions.HTTPError('boom')
+
+        with self.assertRaises(APIConnectionError):
+            self.requestor.get(method='users.getCurrentUser')
@@ -0,0 +1,271 @@
+# coding: utf-8
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+import mock
+
+from pyodnoklassniki import (
+    OdnoklassnikiAPI, AuthError, InvalidRequestError, errors
+)
+from pyodnoklassniki.exceptions import APIConnectionError
+from pyodnoklassniki.writebehind import SQLiteSpool, WriteBehindDispatcher
+from .utils import FakeClock
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Condition is not met in time')
+        time.sleep(0.01)
+
+
+class WriteBehindDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.spool = SQLiteSpool(os.path.join(self.tmp_dir, 'spool.db'))
+        self.clock = FakeClock()
+        self.dispatcher = WriteBehindDispatcher(self.spool, concurrency=1,
+                                                clock=self.clock)
+        self.ok_api = OdnoklassnikiAPI(access_token='access token')
+
+        patcher = mock.patch('pyodnoklassniki.requestor.json_api_response',
+                             autospec=True)
+        self.json_api_response = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.dispatcher.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_submit_does_not_call_api(self):
+        self.dispatcher.submit(self.ok_api.users.setStatus, status='Hi')
+
+        self.assertEqual(len(self.spool), 1)
+        self.assertFalse(self.json_api_response.called)
+
+    def test_drain_executes_spooled_call(self):
+        self.dispatcher.submit(self.ok_api.notifications.sendSimple,
+                               uid=1, text='Hi')
+
+        self.assertEqual(self.dispatcher.drain(), 1)
+        query_params = self.json_api_response.call_args[0][1]
+        self.assertEqual(query_params['method'], 'notifications.sendSimple')
+        self.assertEqual(query_params['access_token'], 'access token')
+        self.assertEqual(query_params['text'], 'Hi')
+        self.assertEqual(len(self.spool), 0)
+
+    def test_identical_calls_are_deduplicated(self):
+        self.dispatcher.submit(self.ok_api.notifications.sendSimple,
+                               uid=1, text='Hi')
+        self.dispatcher.submit(self.ok_api.notifications.sendSimple,
+                               uid=1, text='Hi')
+        self.dispatcher.submit(self.ok_api.notifications.sendSimple,
+                               uid=2, text='Hi')
+
+        self.assertEqual(len(self.spool), 2)
+
+    def test_status_updates_are_coalesced(self):
+        self.dispatcher.submit(self.ok_api.users.setStatus, status='one')
+        self.dispatcher.submit(self.ok_api.users.setStatus, status='two')
+        other_api = OdnoklassnikiAPI(access_token='other token')
+        self.dispatcher.submit(other_api.users.setStatus, status='three')
+
+        calls = self.spool.ready(self.clock(), 10)
+        self.assertEqual([c.call['params']['status'] for c in calls],
+                         ['two', 'three'])
+
+    def test_invalid_request_error_moves_call_to_dead_letters(self):
+        self.json_api_response.side_effect = InvalidRequestError(
+            'PARAM : Missed required parameter', code=errors.PARAM)
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+
+        self.dispatcher.drain()
+
+        self.assertEqual(len(self.spool), 0)
+        dead_letter, = self.spool.dead_letters()
+        self.assertEqual(dead_letter.call['method'], 'mediatopic.post')
+        self.assertEqual(dead_letter.error_code, errors.PARAM)
+
+    def test_connection_error_is_retried_with_backoff(self):
+        self.json_api_response.side_effect = APIConnectionError('timeout')
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+
+        self.dispatcher.drain()
+        self.assertEqual(self.dispatcher.drain(), 0)
+        self.assertEqual(self.json_api_response.call_count, 1)
+
+        self.clock.now += self.dispatcher.retry_delay
+        self.json_api_response.side_effect = None
+        self.assertEqual(self.dispatcher.drain(), 1)
+
+    def test_call_is_buried_after_max_attempts(self):
+        self.json_api_response.side_effect = APIConnectionError('timeout')
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+
+        for _ in range(self.dispatcher.max_attempts):
+            self.dispatcher.drain()
+            self.clock.now += 1000
+
+        self.assertEqual(len(self.spool), 0)
+        self.assertEqual(len(self.spool.dead_letters()), 1)
+
+    def test_flood_blocked_pauses_dispatching(self):
+        self.json_api_response.side_effect = AuthError(
+            'FLOOD_BLOCKED', code=errors.FLOOD_BLOCKED)
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=2)
+
+        self.dispatcher.drain()
+
+        # The second call is skipped once the first one is blocked.
+        self.assertEqual(self.json_api_response.call_count, 1)
+        self.assertEqual(len(self.spool), 2)
+
+        self.clock.now += self.dispatcher.flood_delay - 1
+        self.assertEqual(self.dispatcher.drain(), 0)
+
+        self.clock.now += 1
+        self.json_api_response.side_effect = None
+        self.assertEqual(self.dispatcher.drain(), 2)
+        self.assertEqual(self.spool.dead_letters(), [])
+
+    def test_unexpected_exception_is_retried(self):
+        self.json_api_response.side_effect = KeyError('error_code')
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+
+        self.assertEqual(self.dispatcher.drain(), 0)
+        spooled, = self.spool.ready(self.clock() + 1000, 10)
+        self.assertEqual(spooled.attempts, 1)
+        self.assertEqual(self.spool.dead_letters(), [])
+
+    def test_limit_reached_pauses_dispatching(self):
+        self.json_api_response.side_effect = AuthError(
+            'LIMIT_REACHED', code=errors.LIMIT_REACHED)
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+
+        self.dispatcher.drain()
+
+        self.assertEqual(self.spool.dead_letters(), [])
+        self.clock.now += self.dispatcher.flood_delay
+        self.json_api_response.side_effect = None
+        self.assertEqual(self.dispatcher.drain(), 1)
+
+    def test_dead_letter_is_requeued(self):
+        self.json_api_response.side_effect = InvalidRequestError(
+            'PARAM : Missed required parameter', code=errors.PARAM)
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+        self.dispatcher.drain()
+        dead_letter, = self.spool.dead_letters()
+
+        self.dispatcher.requeue_dead_letter(dead_letter.id)
+
+        self.assertEqual(self.spool.dead_letters(), [])
+        self.json_api_response.side_effect = None
+        self.assertEqual(self.dispatcher.drain(), 1)
+
+    def test_requeue_of_unknown_dead_letter_raises_key_error(self):
+        with self.assertRaises(KeyError):
+            self.dispatcher.requeue_dead_letter(1)
+
+    def test_old_dead_letters_are_purged(self):
+        self.json_api_response.side_effect = InvalidRequestError(
+            'PARAM : Missed required parameter', code=errors.PARAM)
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+        self.dispatcher.drain()
+        self.clock.now += 100
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=2)
+        self.dispatcher.drain()
+
+        self.assertEqual(self.spool.purge_dead_letters(self.clock()), 1)
+        dead_letter, = self.spool.dead_letters()
+        self.assertEqual(dead_letter.call['params'], {'gid': 2})
+
+    def test_background_thread_survives_unexpected_exception(self):
+        def json_api_response(api_url, query_params):
+            if query_params['gid'] == 1:
+                raise KeyError('error_code')
+        self.json_api_response.side_effect = json_api_response
+        self.dispatcher.poll_interval = 0.01
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+
+        self.dispatcher.start()
+        wait_for(lambda: self.json_api_response.called)
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=2)
+        wait_for(lambda: self.json_api_response.call_count == 2)
+        wait_for(lambda: len(self.spool) == 1)
+
+        self.assertTrue(self.dispatcher._thread.is_alive())
+
+    def test_background_thread_survives_failed_drain(self):
+        ready = self.spool.ready
+        self.spool.ready = mock.Mock(side_effect=[RuntimeError('boom')])
+        self.dispatcher.poll_interval = 0.01
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+
+        self.dispatcher.start()
+        wait_for(lambda: self.spool.ready.called)
+        self.spool.ready = ready
+        wait_for(lambda: len(self.spool) == 0)
+
+        self.assertTrue(self.dispatcher._thread.is_alive())
+
+    def test_calls_are_not_resent_while_lease_lasts(self):
+        self.dispatcher.concurrency = 2
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=1)
+        self.dispatcher.submit(self.ok_api.mediatopic.post, gid=2)
+        delete = self.spool.delete
+
+        def delete_once_locked(call_id):
+            if self.spool.delete.call_count == 1:
+                raise sqlite3.OperationalError('database is locked')
+            delete(call_id)
+        self.spool.delete = mock.Mock(side_effect=delete_once_locked)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            self.dispatcher.drain()
+        # Drain raises only after every call of the batch is finished.
+        self.assertEqual(self.json_api_response.call_count, 2)
+        self.spool.delete = delete
+
+        self.assertEqual(self.dispatcher.drain(), 0)
+        self.assertEqual(self.json_api_response.call_count, 2)
+
+        # Call which result has not been recorded is executed again.
+        self.clock.now += self.dispatcher.lease_timeout
+        self.assertEqual(self.dispatcher.drain(), 1)
+        self.assertEqual(self.json_api_response.call_count, 3)
+        self.assertEqual(len(self.spool), 0)
+
+    def test_requeued_status_does_not_replace_newer_one(self):
+        self.json_api_response.side_effect = APIConnectionError('timeout')
+        self.dispatcher.max_attempts = 1
+        self.dispatcher.submit(self.ok_api.users.setStatus, status='old')
+        self.dispatcher.drain()
+        dead_letter, = self.spool.dead_letters()
+        new_id = self.dispatcher.submit(self.ok_api.users.setStatus,
+                                        status='new')
+
+        call_id = self.dispatcher.requeue_dead_letter(dead_letter.id)
+
+        self.assertEqual(call_id, new_id)
+        self.assertEqual(self.spool.dead_letters(), [])
+        spooled, = self.spool.ready(self.clock(), 10)
+        self.assertEqual(spooled.call['params'], {'status': 'new'})
+
+    def test_spool_survives_dispatcher_restart(self):
+        self.dispatcher.submit(self.ok_api.users.setStatus, status='Hi')
+
+        spool = SQLiteSpool(self.spool.path)
+        dispatcher = WriteBehindDispatcher(spool, concurrency=1,
+                                           clock=self.clock)
+
+        self.assertEqual(dispatcher.drain(), 1)
+        dispatcher.stop()
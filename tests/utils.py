@@ -10,3 +10,12 @@ class MockResponse(object):
 
     def json(self):
         return json.loads(self.content)
+
+
+class FakeClock(object):
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now